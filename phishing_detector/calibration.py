@@ -0,0 +1,43 @@
+# calibration.py
+# Isotonic calibration on top of an already-fitted model.
+# Replaces CalibratedClassifierCV(cv=5), which refit the pipeline five times and
+# averaged five models at inference; here the model is fitted once and only the
+# isotonic map is learned on a held-out split.
+
+from __future__ import annotations
+
+import numpy as np
+from sklearn.isotonic import IsotonicRegression
+
+
+class PrefitIsotonic:
+    """
+    Wraps a fitted binary classifier/pipeline with an isotonic map learned on
+    held-out scores. Exposes predict_proba like a scikit-learn classifier, so
+    joblib-saved models drop into phishing_api unchanged.
+    """
+
+    def __init__(self, base, iso: IsotonicRegression | None = None):
+        self.base = base
+        self.iso = iso
+
+    @property
+    def classes_(self):
+        return self.base.classes_
+
+    def fit(self, X_val, y_val) -> "PrefitIsotonic":
+        """Learn the isotonic map from the (already fitted) base model's scores on X_val."""
+        p = self.base.predict_proba(X_val)[:, 1]
+        self.iso = IsotonicRegression(out_of_bounds="clip").fit(p, y_val)
+        return self
+
+    def calibrate(self, p1: np.ndarray) -> np.ndarray:
+        """Map raw positive-class probabilities to calibrated ones."""
+        return self.iso.transform(np.asarray(p1, dtype=float))
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.calibrate(self.base.predict_proba(X)[:, 1])
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[(self.predict_proba(X)[:, 1] >= 0.5).astype(int)]
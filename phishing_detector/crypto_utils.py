@@ -1,9 +1,14 @@
 # crypto_utils.py
-import os, json, base64, secrets, time
+import os, base64, secrets, time, hmac, hashlib
+from functools import lru_cache
+import orjson
 from typing import Tuple, Dict
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding, rsa
-from cryptography.hazmat.primitives.hmac import HMAC
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ed25519
+
+# Stateless padding/hash objects, built once and shared by every sign/verify
+_PKCS1  = padding.PKCS1v15()
+_SHA256 = hashes.SHA256()
 
 # --- helpers ---
 def b64(x: bytes) -> str:
@@ -13,8 +18,9 @@ def b64d(s: str) -> bytes:
     return base64.b64decode(s.encode("ascii"))
 
 def canonical_bytes(payload: dict) -> bytes:
-    # Sort keys; compact separators to match clients
-    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    # Sort keys (at all levels); orjson is compact and emits raw UTF-8 like the
+    # clients' JSON.stringify
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
 
 # --- key loading/generation ---
 def load_or_make_hmac_key() -> bytes:
@@ -27,15 +33,23 @@ def load_or_make_hmac_key() -> bytes:
             return bytes.fromhex(k)
     return secrets.token_bytes(32)
 
-def load_or_make_rsa() -> Tuple[object, object, str]:
+def _check_key(key, expected, path: str):
+    # Keys are parsed once at start-up; fail there rather than on the first request
+    if not isinstance(key, expected):
+        raise TypeError(f"{path}: expected {expected.__name__}, got {type(key).__name__}")
+    return key
+
+def load_or_make_rsa() -> Tuple[rsa.RSAPrivateKey, rsa.RSAPublicKey, str]:
     priv_path = os.getenv("RSA_PRIV_PEM", "").strip()
     pub_path  = os.getenv("RSA_PUB_PEM", "").strip()
     if priv_path and os.path.exists(priv_path):
         with open(priv_path, "rb") as f:
-            priv = serialization.load_pem_private_key(f.read(), password=None)
+            priv = _check_key(serialization.load_pem_private_key(f.read(), password=None),
+                              rsa.RSAPrivateKey, priv_path)
         if pub_path and os.path.exists(pub_path):
             with open(pub_path, "rb") as f:
-                pub = serialization.load_pem_public_key(f.read())
+                pub = _check_key(serialization.load_pem_public_key(f.read()),
+                                 rsa.RSAPublicKey, pub_path)
         else:
             pub = priv.public_key()
     else:
@@ -49,25 +63,73 @@ def load_or_make_rsa() -> Tuple[object, object, str]:
     ).decode("utf-8")
     return priv, pub, pub_pem
 
+def load_or_make_ed25519() -> Tuple[ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey, str]:
+    """Ed25519 counterpart of load_or_make_rsa (ED25519_PRIV_PEM / ED25519_PUB_PEM)."""
+    priv_path = os.getenv("ED25519_PRIV_PEM", "").strip()
+    pub_path  = os.getenv("ED25519_PUB_PEM", "").strip()
+    if priv_path and os.path.exists(priv_path):
+        with open(priv_path, "rb") as f:
+            priv = _check_key(serialization.load_pem_private_key(f.read(), password=None),
+                              ed25519.Ed25519PrivateKey, priv_path)
+        if pub_path and os.path.exists(pub_path):
+            with open(pub_path, "rb") as f:
+                pub = _check_key(serialization.load_pem_public_key(f.read()),
+                                 ed25519.Ed25519PublicKey, pub_path)
+        else:
+            pub = priv.public_key()
+    else:
+        # ephemeral for dev
+        priv = ed25519.Ed25519PrivateKey.generate()
+        pub  = priv.public_key()
+
+    pub_pem = pub.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode("utf-8")
+    return priv, pub, pub_pem
+
+def load_or_make_signing_key(alg: str) -> Tuple[object, object, str]:
+    """alg: 'rsa' (default, PKCS#1 v1.5) or 'ed25519'."""
+    if alg == "ed25519":
+        return load_or_make_ed25519()
+    return load_or_make_rsa()
+
+def sig_alg_name(key) -> str:
+    """WebCrypto algorithm name for a private or public key."""
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "Ed25519"
+    return "RSASSA-PKCS1-v1_5"
+
 # --- MAC + signature ---
-def sign_and_mac(payload: dict, hmac_key: bytes, rsa_priv) -> Dict[str, str]:
+def sign_and_mac(payload: dict, hmac_key: bytes, sign_priv) -> Dict[str, str]:
     msg = canonical_bytes(payload)
 
     # HMAC for integrity+replay protection with shared secret
-    h = HMAC(hmac_key, hashes.SHA256())
-    h.update(msg)
-    hmac_b64 = b64(h.finalize())
+    # (stdlib hmac/hashlib goes straight to OpenSSL's one-shot HMAC)
+    hmac_b64 = b64(hmac.digest(hmac_key, msg, hashlib.sha256))
 
-    # RSA PKCS#1 v1.5 + SHA-256 for public verification
-    sig = rsa_priv.sign(msg, padding.PKCS1v15(), hashes.SHA256())
+    # Public verification: Ed25519, or RSA PKCS#1 v1.5 + SHA-256
+    if isinstance(sign_priv, ed25519.Ed25519PrivateKey):
+        sig = sign_priv.sign(msg)
+    else:
+        sig = sign_priv.sign(msg, _PKCS1, _SHA256)
     sig_b64 = b64(sig)
     return {"hmac": hmac_b64, "signature": sig_b64}
 
+@lru_cache(maxsize=128)
+def _load_pub(pub_pem: str):
+    # PEM decode + ASN.1 parse is the slow part of verification; do it once per key
+    return serialization.load_pem_public_key(pub_pem.encode("utf-8"))
+
 def verify_rsa(pub_pem: str, payload: dict, signature_b64: str) -> bool:
+    """Verify a sign_and_mac signature; accepts RSA or Ed25519 public keys."""
     try:
-        pub = serialization.load_pem_public_key(pub_pem.encode("utf-8"))
+        pub = _load_pub(pub_pem)
         sig = b64d(signature_b64)
-        pub.verify(sig, canonical_bytes(payload), padding.PKCS1v15(), hashes.SHA256())
+        if isinstance(pub, ed25519.Ed25519PublicKey):
+            pub.verify(sig, canonical_bytes(payload))
+        else:
+            pub.verify(sig, canonical_bytes(payload), _PKCS1, _SHA256)
         return True
     except Exception:
         return False
@@ -1,8 +1,10 @@
 # curate_urls.py
+import re
+
 import pandas as pd
 import numpy as np
-import tldextract
-from urllib.parse import urlparse
+
+from url_utils import SCHEME_RE, etld1_host
 
 PHISH_CSV = "Phishing.csv"
 BENIGN_CSV = "All.csv"
@@ -12,40 +14,38 @@ MAX_PER_DOMAIN_LEGIT = 40
 MAX_PER_DOMAIN_PHISH = 30
 TARGET_PER_BUCKET = 300
 
-# path buckets for diversity
-def path_bucket(p: str, q: str) -> str:
-    depth = p.count("/")
-    L = len(p)
-    has_q = 1 if q else 0
-    if L <= 1 and not has_q: return "short_plain"
-    if L <= 1 and has_q:     return "short_query"
-    if L <= 15:              return "med"
-    if L <= 50:              return "long"
-    return "xl"
+# scheme://host path ?query  (#fragment ignored, same split as urlsplit)
+URL_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)([^?#]*)(?:\?([^#]*))?")
+
+# path buckets for diversity (vectorized over whole columns)
+def path_bucket(path: pd.Series, query: pd.Series) -> np.ndarray:
+    L = path.str.len()
+    has_q = query.str.len() > 0
+    return np.select(
+        [(L <= 1) & ~has_q, (L <= 1) & has_q, L <= 15, L <= 50],
+        ["short_plain", "short_query", "med", "long"],
+        default="xl",
+    )
 
 def normalize_url(u: str) -> str:
     u = str(u).strip()
     if not u:
         return ""
-    if "://" not in u:
+    if not SCHEME_RE.match(u):
         u = "http://" + u
     return u
 
-def etld1(u: str) -> str:
-    e = tldextract.extract(u)
-    return (f"{e.domain}.{e.suffix}".lower() if e.suffix else e.domain.lower())
-
 def load_and_clean(path: str, label: str) -> pd.DataFrame:
     df = pd.read_csv(path)
     if "url" not in df.columns:
         df = df.rename(columns={df.columns[0]:"url"})
     df["url"] = df["url"].astype(str).map(normalize_url)
-    p = df["url"].map(urlparse)
-    df["host"] = p.map(lambda x: x.netloc.lower())
-    df["path"] = p.map(lambda x: x.path or "/")
-    df["query"] = p.map(lambda x: x.query or "")
-    df["bucket"] = [path_bucket(pth, qry) for pth, qry in zip(df["path"], df["query"])]
-    df["etld1"] = df["url"].map(etld1)
+    parts = df["url"].str.extract(URL_RE, expand=True)
+    df["host"] = parts[0].fillna("").str.lower()
+    df["path"] = parts[1].fillna("").replace("", "/")
+    df["query"] = parts[2].fillna("")
+    df["bucket"] = path_bucket(df["path"], df["query"])
+    df["etld1"] = df["host"].map(etld1_host)
     df = df[df["host"].str.len() > 0]
     df["label"] = label
     df = df.drop_duplicates(subset=["url"])
@@ -0,0 +1,12 @@
+# dataset_io.py
+# Loading the feature datasets written by build_dataset.py.
+from pathlib import Path
+
+import pandas as pd
+
+def read_dataset(path):
+    """Load a feature dataset; falls back to the legacy .csv if the .parquet isn't built yet."""
+    p = Path(path)
+    if p.suffix == ".parquet" and not p.exists():
+        p = p.with_suffix(".csv")
+    return pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
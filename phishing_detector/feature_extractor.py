@@ -1,7 +1,8 @@
 # feature_extractor.py
 # Robust feature extractor for PhishGuard 414
 # - 86 features (80 URL heuristics + WHOIS + DOM + CT set)
-# - Cache-first (feature_cache.json)
+# - Cache-first (feature_cache.sqlite; legacy feature_cache.json is imported once)
+# - Optional per-URL cache of the 80 URL heuristics for dataset rebuilds
 # - Neutral fallbacks on failure or unknown fields (no "scare" defaults)
 # - Meta info about sources (cache/network/fallback) for debugging
 
@@ -12,16 +13,29 @@ import re
 import math
 import json
 import socket
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, Tuple, Optional, List
-from urllib.parse import urlparse, parse_qs, urljoin
+from urllib.parse import urlsplit, uses_params, parse_qs, urljoin
 from datetime import datetime, timezone
 
+import numpy as np
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 import whois
 import tldextract
 
+try:  # optional JIT for the run-length kernel; pure-regex path otherwise
+    from numba import njit
+except ImportError:
+    njit = None
+
 # ----------------------------
 # Constants
 # ----------------------------
@@ -31,8 +45,68 @@ CONSONANTS = set("bcdfghjklmnpqrstvwxyz")
 EXEC_EXTS = {".exe", ".bat", ".cmd", ".scr", ".com", ".pif"}
 SENSITIVE = ["login", "secure", "account", "update", "verify", "bank", "signin"]
 SYM = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
-
-DEFAULT_CACHE_PATH = Path("feature_cache.json")
+URL_DELIMS = set("/:.*?=&-")
+
+_DIGIT_RE = re.compile(r"\d+")
+_RUN_RE = re.compile(r"(.)\1*")
+
+# Byte -> character-class table for ASCII segments: a byte histogram times this
+# (256 x 6) table yields every per-class count in one C-level pass.
+# Vowels/consonants match both cases (features count them on the lowercased URL).
+_COUNT_KEYS = ("digits", "alpha", "vowels", "consonants", "symbols", "special")
+_CLASS_LUT = np.zeros((256, len(_COUNT_KEYS)), dtype=np.int64)
+for _b in range(128):
+    _c = chr(_b)
+    _CLASS_LUT[_b] = (
+        _c.isdigit(),
+        _c.isalpha(),
+        _c.lower() in VOWELS,
+        _c.lower() in CONSONANTS,
+        _c in SYM,
+        not _c.isalnum() and _c not in URL_DELIMS,
+    )
+del _b, _c
+
+DEFAULT_CACHE_PATH = Path("feature_cache.sqlite")
+N_FEATURES = 86
+N_URL_FEATURES = 80
+
+# Bump whenever _url_features() changes: rows written under another version are
+# treated as misses, so stale URL-level cache entries never leak into a dataset.
+URL_FEATURES_VERSION = 1
+
+# DOM signals (forms, password inputs, iframes, resource links) sit well within
+# the first few hundred KB; don't download/parse the rest of bloated pages.
+DOM_MAX_BYTES = 256_000
+
+# 1-based positions that repeat an earlier feature -> the feature they repeat.
+# They stay in the default 86-dim vector so existing datasets/models keep working;
+# pass drop_duplicate_features=True to get the de-duplicated vector instead.
+DUPLICATE_FEATURES = {
+    39: 15, 40: 16, 41: 17, 42: 18, 44: 19,  # digit counts (url, host, path, fname, query)
+    52: 5,                                   # longest domain token
+    53: 51, 54: 51,                          # longest path token
+    57: 1,                                   # query parameter count
+    86: 80,                                  # CT flag
+}
+
+# One shared connection per cache DB; the lock serializes access from worker threads
+_CACHE_LOCK = threading.Lock()
+_CACHE_DBS: Dict[str, sqlite3.Connection] = {}
+
+# Per-(cache DB, eTLD+1) locks so concurrent misses on one domain fetch it once
+_DOMAIN_LOCKS_GUARD = threading.Lock()
+_DOMAIN_LOCKS: Dict[Tuple[str, str], threading.Lock] = {}
+
+# Shared HTTP session: keep-alive + pooled connections amortize the TLS handshake
+# across many crt.sh / DOM requests (most CT lookups hit the same host).
+_SESSION = requests.Session()
+# ACCEPT_ENCODING advertises br/zstd only when urllib3 can actually decode them
+_SESSION.headers.update({"User-Agent": "Mozilla/5.0", "Accept-Encoding": ACCEPT_ENCODING})
+_ADAPTER = HTTPAdapter(pool_connections=64, pool_maxsize=64,
+                       max_retries=Retry(total=2, backoff_factor=0.3))
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
 
 # ----------------------------
 # Helpers
@@ -47,24 +121,215 @@ def shannon_entropy(s: str) -> float:
     ln = len(s)
     return -sum((cnt / ln) * math.log2(cnt / ln) for cnt in freq.values())
 
-def _load_cache(p: Path) -> Dict[str, dict]:
-    if p.exists():
-        try:
-            return json.loads(p.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
-
-def _save_cache(cache: Dict[str, dict], p: Path) -> None:
-    tmp = p.with_suffix(".tmp")
+def _resolve_cache_paths(p: Path) -> Tuple[Path, Path]:
+    """
+    Returns (db_path, legacy_json_path). A '.json' path is accepted for
+    backward compatibility and mapped to the SQLite file next to it.
+    """
+    if p.suffix == ".json":
+        return p.with_suffix(".sqlite"), p
+    return p, p.with_suffix(".json")
+
+def _cache_db(p: Path) -> sqlite3.Connection:
+    conn = _CACHE_DBS.get(str(p))  # fast path: skip resolve() on every lookup
+    if conn is not None:
+        return conn
+    db_path, legacy = _resolve_cache_paths(p)
+    key = str(db_path.resolve())
+    with _CACHE_LOCK:
+        conn = _CACHE_DBS.get(key)
+        if conn is not None:
+            _CACHE_DBS[str(p)] = conn
+            return conn
+        fresh = not db_path.exists()
+        conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (etld1 TEXT PRIMARY KEY, blob TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS url_cache "
+            "(url TEXT PRIMARY KEY, version INTEGER NOT NULL, full_url TEXT NOT NULL, feats BLOB NOT NULL)"
+        )
+        if fresh and legacy.exists():
+            _import_rows(conn, _read_json_cache(legacy))
+        conn.commit()
+        _CACHE_DBS[key] = _CACHE_DBS[str(p)] = conn
+        return conn
+
+def _read_json_cache(p: Path) -> Dict[str, dict]:
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _import_rows(conn: sqlite3.Connection, cache: Dict[str, dict]) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO cache (etld1, blob) VALUES (?, ?)",
+        ((hk, json.dumps(v, ensure_ascii=False)) for hk, v in cache.items()),
+    )
+
+@contextmanager
+def _domain_lock(p: Path, hk: str):
+    key = (str(p), hk)
+    with _DOMAIN_LOCKS_GUARD:
+        lock = _DOMAIN_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        yield
+    # Drop the entry once the row is written; a thread that still creates a
+    # fresh lock just re-reads the cache under it and finds the row.
+    with _DOMAIN_LOCKS_GUARD:
+        _DOMAIN_LOCKS.pop(key, None)
+
+def _cache_get(p: Path, hk: str) -> Optional[dict]:
+    conn = _cache_db(p)
+    with _CACHE_LOCK:
+        row = conn.execute("SELECT blob FROM cache WHERE etld1 = ?", (hk,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _cache_put(p: Path, hk: str, values: dict) -> None:
+    conn = _cache_db(p)
+    blob = json.dumps(values, ensure_ascii=False)
+    with _CACHE_LOCK:
+        conn.execute("INSERT OR REPLACE INTO cache (etld1, blob) VALUES (?, ?)", (hk, blob))
+        conn.commit()
+
+def _url_cache_get(p: Path, url: str) -> Optional[Tuple[str, List[float]]]:
+    conn = _cache_db(p)
+    with _CACHE_LOCK:
+        row = conn.execute(
+            "SELECT full_url, feats FROM url_cache WHERE url = ? AND version = ?",
+            (url, URL_FEATURES_VERSION),
+        ).fetchone()
+    if row is None:
+        return None
+    return row[0], array("d", row[1]).tolist()
+
+def _url_cache_put(p: Path, url: str, full_url: str, feats: List[float]) -> None:
+    conn = _cache_db(p)
+    blob = array("d", feats).tobytes()
+    with _CACHE_LOCK:
+        conn.execute(
+            "INSERT OR REPLACE INTO url_cache (url, version, full_url, feats) VALUES (?, ?, ?, ?)",
+            (url, URL_FEATURES_VERSION, full_url, blob),
+        )
+        conn.commit()
+
+def import_json_cache(json_path: str, cache_path: Optional[str] = None) -> int:
+    """Merge a legacy feature_cache.json into the SQLite cache. Returns rows imported."""
+    cache = _read_json_cache(Path(json_path))
+    conn = _cache_db(Path(cache_path) if cache_path else DEFAULT_CACHE_PATH)
+    with _CACHE_LOCK:
+        _import_rows(conn, cache)
+        conn.commit()
+    return len(cache)
+
+def export_json_cache(json_path: str, cache_path: Optional[str] = None) -> int:
+    """Dump the SQLite cache to the legacy {etld1: values} JSON layout. Returns rows exported."""
+    conn = _cache_db(Path(cache_path) if cache_path else DEFAULT_CACHE_PATH)
+    with _CACHE_LOCK:
+        rows = conn.execute("SELECT etld1, blob FROM cache").fetchall()
+    cache = {hk: json.loads(blob) for hk, blob in rows}
+    tmp = Path(json_path).with_suffix(".tmp")
     tmp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
-    tmp.replace(p)
+    tmp.replace(json_path)
+    return len(cache)
 
 def _etld1_from_url(url: str) -> str:
     e = tldextract.extract(url)
     if e.suffix:
         return f"{e.domain}.{e.suffix}".lower()
-    return (e.domain or urlparse(url).netloc).lower()
+    return (e.domain or urlsplit(url).netloc).lower()
+
+def _counts(seg: str) -> Dict[str, int]:
+    """
+    Character-class counts for one URL segment: digits, alpha, vowels,
+    consonants, symbols (SYM) and special (non-alnum, non-delimiter).
+    """
+    if seg.isascii():
+        hist = np.bincount(np.frombuffer(seg.encode("ascii"), dtype=np.uint8), minlength=256)
+        return dict(zip(_COUNT_KEYS, (int(n) for n in hist @ _CLASS_LUT)))
+    # Non-ASCII: str.isdigit/isalpha are Unicode-aware, so keep the exact Python semantics
+    lower = seg.lower()
+    return {
+        "digits": sum(c.isdigit() for c in seg),
+        "alpha": sum(c.isalpha() for c in seg),
+        "vowels": sum(c in VOWELS for c in lower),
+        "consonants": sum(c in CONSONANTS for c in lower),
+        "symbols": sum(c in SYM for c in seg),
+        "special": sum(1 for c in seg if not c.isalnum() and c not in URL_DELIMS),
+    }
+
+def _counts_many(segs: Tuple[str, ...]) -> List[Dict[str, int]]:
+    """
+    _counts() for several segments at once: a single bincount over the
+    concatenated bytes, offset by segment, instead of one call per segment.
+    """
+    joined = "".join(segs)
+    if not joined.isascii():
+        return [_counts(seg) for seg in segs]
+    n = len(segs)
+    offs = np.repeat(np.arange(n) * 256, [len(seg) for seg in segs])
+    hist = np.bincount(offs + np.frombuffer(joined.encode("ascii"), dtype=np.uint8), minlength=n * 256)
+    return [dict(zip(_COUNT_KEYS, row)) for row in (hist.reshape(n, 256) @ _CLASS_LUT).tolist()]
+
+def _longest_runs_kernel(a: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Single pass over the concatenated ASCII bytes of several segments.
+    Returns (longest digit run per segment, longest same-char run of the
+    first segment). Newlines never count toward a same-char run, matching
+    the regex (.)\1* this replaces.
+    """
+    digit = np.zeros(ends.shape[0], dtype=np.int64)
+    same = 0
+    start = 0
+    for k in range(ends.shape[0]):
+        dr, sr, prev = 0, 0, -1
+        for i in range(start, ends[k]):
+            b = a[i]
+            if 48 <= b <= 57:
+                dr += 1
+                if dr > digit[k]:
+                    digit[k] = dr
+            else:
+                dr = 0
+            if k == 0:
+                if b == 10:
+                    sr, prev = 0, -1
+                elif b == prev:
+                    sr += 1
+                else:
+                    sr, prev = 1, b
+                if sr > same:
+                    same = sr
+        start = ends[k]
+    return digit, same
+
+_longest_runs = njit(cache=True)(_longest_runs_kernel) if njit is not None else None
+
+def _segment_runs(segs: Tuple[str, ...]) -> Tuple[List[int], int]:
+    """
+    (longest digit run per segment, longest same-char run of segs[0]).
+    Uses the Numba kernel for ASCII input, regexes otherwise.
+    """
+    joined = "".join(segs)
+    if _longest_runs is not None and joined.isascii():
+        a = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+        ends = np.cumsum([len(seg) for seg in segs], dtype=np.int64)
+        digit, same = _longest_runs(a, ends)
+        return digit.tolist(), int(same)
+    digit = [max((len(m.group(0)) for m in _DIGIT_RE.finditer(seg)), default=0) for seg in segs]
+    same = max((len(m.group(0)) for m in _RUN_RE.finditer(segs[0])), default=0)
+    return digit, same
+
+def _strip_params(scheme: str, path: str) -> str:
+    """
+    Drop ';params' from the last path segment, as urlparse() does for
+    http(s), so features stay identical to the urlparse-based extractor.
+    """
+    if scheme not in uses_params or ";" not in path:
+        return path
+    i = path.find(";", path.rfind("/")) if "/" in path else path.find(";")
+    return path if i < 0 else path[:i]
 
 def _is_ip(host: str) -> int:
     try:
@@ -99,7 +364,7 @@ def _fetch_ct_flag(host: str) -> int:
     """
     0 if crt.sh returns any entries (has CT log), 1 otherwise.
     """
-    r = requests.get(f"https://crt.sh/?q={host}&output=json", timeout=4)
+    r = _SESSION.get(f"https://crt.sh/?q={host}&output=json", timeout=4)
     if r.ok:
         try:
             data = r.json()
@@ -112,30 +377,29 @@ def _fetch_dom_metrics(url: str) -> Tuple[int, int, float, int]:
     """
     Returns (num_forms, has_password, ext_int_ratio, iframes)
     """
-    r = requests.get(url, timeout=6, headers={"User-Agent": "Mozilla/5.0"})
-    soup = BeautifulSoup(r.text, "html.parser")
+    with _SESSION.get(url, timeout=6, stream=True) as r:
+        html = r.raw.read(DOM_MAX_BYTES, decode_content=True)
+    tree = LexborHTMLParser(html)
 
-    forms = soup.find_all("form")
-    num_forms = len(forms)
-    has_password = 1 if soup.find("input", {"type": "password"}) else 0
+    num_forms = len(tree.css("form"))
+    has_password = 1 if tree.css_first('input[type="password"]') else 0
 
-    domain = urlparse(url).netloc.lower()
+    domain = urlsplit(url).netloc.lower()
     links: List[str] = []
     for tag, attr in (("img", "src"), ("script", "src"), ("link", "href")):
-        for el in soup.find_all(tag):
-            if el.has_attr(attr):
-                links.append(urljoin(url, el[attr]))
+        for el in tree.css(f"{tag}[{attr}]"):
+            links.append(urljoin(url, el.attributes.get(attr) or ""))
 
     ext, inter = 0, 0
     for l in links:
-        host = urlparse(l).netloc.lower()
+        host = urlsplit(l).netloc.lower()
         if host and host != domain:
             ext += 1
         else:
             inter += 1
     ext_int_ratio = ext / max(1, inter)
 
-    iframes = len(soup.find_all("iframe"))
+    iframes = len(tree.css("iframe"))
     return num_forms, has_password, float(ext_int_ratio), iframes
 
 def _neutral_values() -> dict:
@@ -157,38 +421,59 @@ def _merge_meta(sources: Dict[str, str], key: str, value: str) -> Dict[str, str]
     d[key] = value
     return d
 
+def _fetch_domain_values(hk: str, full_url: str) -> dict:
+    """WHOIS/CT/DOM signals from the network; each one falls back to neutral on failure."""
+    # Start from neutral defaults; fill what we can from network
+    values = _neutral_values()
+
+    # WHOIS (unknown age -> neutral, not 0)
+    try:
+        age = _fetch_whois_age_days(hk)
+        if age is None or age <= 0:
+            values["whois_age_days"] = 365
+            values["_source"] = _merge_meta(values["_source"], "whois", "fallback")
+        else:
+            values["whois_age_days"] = int(age)
+            values["_source"] = _merge_meta(values["_source"], "whois", "network")
+    except Exception:
+        values["_source"] = _merge_meta(values["_source"], "whois", "fallback")
+
+    # CT
+    try:
+        ctflag = _fetch_ct_flag(hk)
+        values["ct_flag"] = int(ctflag)
+        values["_source"] = _merge_meta(values["_source"], "ct", "network")
+    except Exception:
+        values["_source"] = _merge_meta(values["_source"], "ct", "fallback")
+
+    # DOM
+    try:
+        f, pw, ratio, ifr = _fetch_dom_metrics(full_url)
+        values["dom_forms"] = int(f)
+        values["dom_has_password"] = int(pw)
+        values["dom_ext_int_ratio"] = float(ratio)
+        values["dom_iframes"] = int(ifr)
+        values["_source"] = _merge_meta(values["_source"], "dom", "network")
+    except Exception:
+        values["_source"] = _merge_meta(values["_source"], "dom", "fallback")
+    return values
+
 # ----------------------------
 # Feature extractor
 # ----------------------------
 
-def extract_features_with_meta(
-    url: str,
-    cache_path: Optional[str] = None,
-    network_mode: str = "cache-first",
-) -> Tuple[List[float], dict]:
+def _url_features(url: str) -> Tuple[str, List[float]]:
     """
-    Build the 86-dim feature vector and return (features, meta).
-
-    network_mode:
-      - 'cache-first' : use cache if present; otherwise try fetch; otherwise neutral fallback.
-      - 'fetch'       : always try fetch, then neutral fallback on failure; also write cache.
-      - 'cache-only'  : only use cache; if missing, write neutral fallback into cache.
-
-    meta = {
-      "sources": {"whois":"cache|network|fallback", "ct": "...", "dom": "..."},
-      "cache_hit": bool,
-      "used_fallback": bool,
-    }
+    The 80 URL-string heuristics (positions 1-80, CT slot left at 0) for a
+    URL that already has a scheme. Returns (normalized full_url, features).
     """
-    # Normalize URL (ensure scheme)
-    if "://" not in url:
-        url = "http://" + url
-    p0 = urlparse(url)
-    full_url = p0.geturl()
-    p = urlparse(full_url)
+    p = urlsplit(url)
+    path = _strip_params(p.scheme, p.path or "")
+    # geturl() normalizes like before (lowercase scheme, no empty '?'/'#');
+    # urlparse also dropped an empty trailing ';' params marker
+    full_url = (p._replace(path=path) if p.path == path + ";" else p).geturl()
 
     host = p.netloc.lower()
-    path = p.path or ""
     query = p.query or ""
     fname = path.rsplit("/", 1)[-1] if "/" in path else path
     ext = ("." + fname.rsplit(".", 1)[-1].lower()) if "." in fname else ""
@@ -196,31 +481,35 @@ def extract_features_with_meta(
     d_toks = [t for t in host.split(".") if t]
     p_toks = [t for t in path.split("/") if t]
     qdict = parse_qs(query)
+    n_q = len(qdict)
+    max_dtok = max((len(t) for t in d_toks), default=0)
+    max_ptok = max((len(t) for t in p_toks), default=0)
 
     u, dm, pd, ql = len(full_url), len(host), len(path), len(query)
     lower_url = full_url.lower()
+    segs = (full_url, host, path, fname, ext, query)
+    c_url, c_host, c_path, c_fname, c_ext, c_query = cnt = _counts_many(segs)
+    digit_runs, char_run = _segment_runs((full_url, host, path, fname, query))
 
     feats: List[float] = []
 
     # ---- 80 URL heuristics in fixed positions ----
-    feats.append(len(qdict))                                      # 1
+    feats.append(n_q)                                             # 1
     feats.append(len(d_toks))                                     # 2
     feats.append(len(p_toks))                                     # 3
     feats.append(sum(len(t) for t in d_toks) / len(d_toks) if d_toks else 0)  # 4
-    feats.append(max((len(t) for t in d_toks), default=0))                    # 5
+    feats.append(max_dtok)                                                    # 5
     feats.append(sum(len(t) for t in p_toks) / len(p_toks) if p_toks else 0)  # 6
     feats.append(len(d_toks[-1]) if d_toks else 0)                            # 7
-    feats.append(sum(c in VOWELS for c in lower_url))                         # 8
-    feats.append(sum(c in CONSONANTS for c in lower_url))                     # 9
+    feats.append(c_url["vowels"])                                             # 8
+    feats.append(c_url["consonants"])                                         # 9
 
     # 10–14 longest digit run per segment
-    for seg in (full_url, host, path, fname, query):
-        runs = [len(m.group(0)) for m in re.finditer(r"\d+", seg)]
-        feats.append(max(runs, default=0))
+    feats += digit_runs
 
     # 15–19 digit count per segment
-    for seg in (full_url, host, path, fname, query):
-        feats.append(sum(c.isdigit() for c in seg))
+    for c in (c_url, c_host, c_path, c_fname, c_query):
+        feats.append(c["digits"])
 
     # 20–26 lengths
     feats += [
@@ -244,24 +533,18 @@ def extract_features_with_meta(
     feats.append(int(":80" in host))                      # 34
     feats.append(full_url.count("."))                     # 35
     feats.append(_is_ip(host))                            # 36
-    runs = [len(m.group(0)) for m in re.finditer(r"(.)\1*", full_url)]
-    feats.append((max(runs, default=0) / (u or 1)))       # 37
+    feats.append((char_run / (u or 1)))                   # 37
     vals = [v for vs in qdict.values() for v in vs]
     feats.append(max((len(v) for v in vals), default=0))  # 38
 
     # 39–44 more digit counts
-    feats += [sum(c.isdigit() for c in seg) for seg in (full_url, host, path, fname, ext, query)]
+    feats += [c["digits"] for c in cnt]
 
     # 45–50 letter counts
-    feats += [sum(c.isalpha() for c in seg) for seg in (full_url, host, path, fname, ext, query)]
+    feats += [c["alpha"] for c in cnt]
 
     # 51–54 longest token lengths
-    feats += [
-        max((len(t) for t in p_toks), default=0),
-        max((len(t) for t in d_toks), default=0),
-        max((len(t) for t in p_toks), default=0),
-        max((len(t) for t in p_toks), default=0),
-    ]
+    feats += [max_ptok, max_dtok, max_ptok, max_ptok]
 
     # 55 longest query key/value
     feats.append(max((len(a) for a in list(qdict.keys()) + vals), default=0))
@@ -270,10 +553,10 @@ def extract_features_with_meta(
     feats.append(int(any(w in lower_url for w in SENSITIVE)))
 
     # 57 distinct query key count
-    feats.append(len(qdict))
+    feats.append(n_q)
 
     # 58 special-char count (excluding typical URL delimiters)
-    feats.append(sum(1 for c in full_url if not c.isalnum() and c not in "/:.*?=&-"))
+    feats.append(c_url["special"])
 
     # 59–61 delimiters
     feats.append(host.count("."))
@@ -281,89 +564,102 @@ def extract_features_with_meta(
     feats.append(host.count(".") + path.count("/"))
 
     # 62–67 digit-rate per segment
-    for seg_len, seg in ((u, full_url), (dm, host), (pd, path), (len(fname), fname), (len(ext), ext), (ql, query)):
-        feats.append((sum(c.isdigit() for c in seg) / (seg_len or 1)))
+    for seg, c in zip(segs, cnt):
+        feats.append((c["digits"] / (len(seg) or 1)))
 
     # 68–73 symbol counts per segment
-    feats += [sum(c in SYM for c in seg) for seg in (full_url, host, path, fname, ext, query)]
+    feats += [c["symbols"] for c in cnt]
 
     # 74–79 entropy per segment
-    feats += [shannon_entropy(seg) for seg in (full_url, host, path, fname, ext, query)]
+    feats += [shannon_entropy(seg) for seg in segs]
 
     # 80 placeholder for CT flag (we'll set after network/cache step)
     feats.append(0)
+    return full_url, feats
 
-    # ---- WHOIS/DOM/CT with cache-first policy ----
+def extract_features_with_meta(
+    url: str,
+    cache_path: Optional[str] = None,
+    network_mode: str = "cache-first",
+    drop_duplicate_features: bool = False,
+    url_cache: bool = False,
+) -> Tuple[List[float], dict]:
+    """
+    Build the 86-dim feature vector and return (features, meta).
+    With drop_duplicate_features=True, positions in DUPLICATE_FEATURES are
+    removed (76 dims); the default layout matches the trained model.
+    With url_cache=True, the 80 URL heuristics are memoized per URL in the
+    cache DB (as float64), so rebuilding a dataset skips recomputing them.
+
+    network_mode:
+      - 'cache-first' : use cache if present; otherwise try fetch; otherwise neutral fallback.
+      - 'fetch'       : always try fetch, then neutral fallback on failure; also write cache.
+      - 'cache-only'  : only use cache; if missing, write neutral fallback into cache.
+
+    meta = {
+      "sources": {"whois":"cache|network|fallback", "ct": "...", "dom": "..."},
+      "cache_hit": bool,
+      "used_fallback": bool,
+    }
+    """
+    # Normalize URL (ensure scheme)
+    if "://" not in url:
+        url = "http://" + url
     cache_file = Path(cache_path) if cache_path else DEFAULT_CACHE_PATH
-    cache = _load_cache(cache_file)
+
+    hit = _url_cache_get(cache_file, url) if url_cache else None
+    if hit is not None:
+        full_url, feats = hit
+    else:
+        full_url, feats = _url_features(url)
+        if url_cache:
+            _url_cache_put(cache_file, url, full_url, feats)
+
+    # ---- WHOIS/DOM/CT with cache-first policy ----
     hk = _etld1_from_url(full_url)
+    cached = _cache_get(cache_file, hk)
 
     meta = {"sources": {"whois": "", "ct": "", "dom": ""}, "cache_hit": False}
     values: dict
 
-    if hk in cache:
-        values = dict(cache[hk])
+    if cached is None:
+        # One fetch per domain: concurrent misses on the same eTLD+1 wait for
+        # the first and then read its row, instead of refetching and racing
+        # to overwrite it (possibly with a rate-limited fallback).
+        with _domain_lock(cache_file, hk):
+            cached = _cache_get(cache_file, hk)
+            if cached is None:
+                if network_mode in ("cache-first", "fetch"):
+                    values = _fetch_domain_values(hk, full_url)
+                else:
+                    # cache-only and not found: write neutral
+                    values = _neutral_values()
+                _cache_put(cache_file, hk, values)
+                meta["sources"] = values["_source"]
+
+    if cached is not None:
+        values = cached
         meta["cache_hit"] = True
         meta["sources"] = values.get("_source", {"whois": "cache", "ct": "cache", "dom": "cache"})
-    elif network_mode in ("cache-first", "fetch"):
-        # Start from neutral defaults; fill what we can from network
-        values = _neutral_values()
-
-        # WHOIS (unknown age -> neutral, not 0)
-        try:
-            age = _fetch_whois_age_days(hk)
-            if age is None or age <= 0:
-                values["whois_age_days"] = 365
-                values["_source"] = _merge_meta(values["_source"], "whois", "fallback")
-            else:
-                values["whois_age_days"] = int(age)
-                values["_source"] = _merge_meta(values["_source"], "whois", "network")
-        except Exception:
-            values["_source"] = _merge_meta(values["_source"], "whois", "fallback")
-
-        # CT
-        try:
-            ctflag = _fetch_ct_flag(hk)
-            values["ct_flag"] = int(ctflag)
-            values["_source"] = _merge_meta(values["_source"], "ct", "network")
-        except Exception:
-            values["_source"] = _merge_meta(values["_source"], "ct", "fallback")
-
-        # DOM
-        try:
-            f, pw, ratio, ifr = _fetch_dom_metrics(full_url)
-            values["dom_forms"] = int(f)
-            values["dom_has_password"] = int(pw)
-            values["dom_ext_int_ratio"] = float(ratio)
-            values["dom_iframes"] = int(ifr)
-            values["_source"] = _merge_meta(values["_source"], "dom", "network")
-        except Exception:
-            values["_source"] = _merge_meta(values["_source"], "dom", "fallback")
-
-        cache[hk] = values
-        _save_cache(cache, cache_file)
-        meta["sources"] = values["_source"]
-    else:
-        # cache-only and not found: write neutral
-        values = _neutral_values()
-        cache[hk] = values
-        _save_cache(cache, cache_file)
-        meta["sources"] = values["_source"]
 
     # Set CT flag at position 80 (index 79), then append the rest to reach 86
-    feats[79] = int(values["ct_flag"])
+    ct_flag = int(values["ct_flag"])
+    feats[79] = ct_flag
     feats += [
         int(values["whois_age_days"]),      # 81
         int(values["dom_forms"]),           # 82
         int(values["dom_has_password"]),    # 83
         float(values["dom_ext_int_ratio"]), # 84
         int(values["dom_iframes"]),         # 85
-        int(values["ct_flag"]),             # 86 (duplicate CT)
+        ct_flag,                            # 86 (duplicate CT)
     ]
 
     # Ensure exact length 86
-    if len(feats) != 86:
-        feats = (feats + [0])[:86]
+    if len(feats) != N_FEATURES:
+        feats = (feats + [0])[:N_FEATURES]
+
+    if drop_duplicate_features:
+        feats = [f for i, f in enumerate(feats, 1) if i not in DUPLICATE_FEATURES]
 
     meta["used_fallback"] = any(v == "fallback" for v in meta["sources"].values())
     return feats, meta
@@ -372,11 +668,16 @@ def extract_features(
     url: str,
     network: bool = False,
     cache_path: Optional[str] = None,
+    drop_duplicate_features: bool = False,
+    url_cache: bool = False,
 ) -> List[float]:
     """
     Backward-compatible wrapper returning ONLY the feature vector.
     Set network=True to force fetch on cache-miss (training-time).
     """
     mode = "fetch" if network else "cache-first"
-    feats, _ = extract_features_with_meta(url, cache_path=cache_path, network_mode=mode)
+    feats, _ = extract_features_with_meta(
+        url, cache_path=cache_path, network_mode=mode,
+        drop_duplicate_features=drop_duplicate_features, url_cache=url_cache,
+    )
     return feats
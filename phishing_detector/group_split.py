@@ -1,12 +1,9 @@
 # group_split.py
 import pandas as pd
-import tldextract
 
 from sklearn.model_selection import GroupShuffleSplit
 
-def etld1(u: str) -> str:
-    e = tldextract.extract(u if "://" in u else ("http://" + u))
-    return (f"{e.domain}.{e.suffix}".lower() if e.suffix else e.domain.lower())
+from url_utils import etld1
 
 def main():
     df = pd.read_csv("urls_and_labels.csv")  # url,label
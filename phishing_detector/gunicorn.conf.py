@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn wsgi:app` when run from this directory.
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.getenv("WORKER_CLASS", "gevent")
+
+# With preload_app the master imports phishing_api (requests, urllib3, ssl)
+# before gunicorn's gevent worker patches the stdlib, which leaves those
+# modules unpatched. Patch here, before the app is loaded.
+if worker_class == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+# Import phishing_api once in the master: the model, trusted lists and signing
+# keys are loaded a single time and shared copy-on-write by the forked workers
+# (ephemeral dev keys are then also the same in every worker). Per-process
+# state -- the batching thread and the ONNX Runtime session -- starts lazily
+# in each worker.
+preload_app = True
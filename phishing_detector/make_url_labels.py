@@ -1,13 +1,15 @@
 # make_url_labels.py
 
+from itertools import product
+
+import numpy as np
 import pandas as pd
 
 def main():
     # 1) Load phishing URLs
     #    (assumes Phishing.csv has a column 'url')
     phish = pd.read_csv('Phishing.csv')
-    phish = phish.rename(columns={phish.columns[0]: 'url'})
-    phish['label'] = 'phishing'
+    phish_urls = phish[phish.columns[0]].to_numpy(dtype=object)
 
     # 2) Define ~100 top domains
     top_domains = [
@@ -29,6 +31,7 @@ def main():
         'mozilla.org','gitlab.com','sourceforge.net','shopify.com','snapchat.com',
         'quora.com','tumblr.com','pinterest.com','cnn.com','forbes.com'
     ]
+    top_domains = list(dict.fromkeys(top_domains))  # drop repeats, keep order
 
     # 3) Patterns to apply per domain (8 each → ~800 benign URLs)
     patterns = [
@@ -43,24 +46,19 @@ def main():
     ]
 
     # 4) Build benign list
-    benign_urls = []
-    for d in top_domains:
-        for pre, suf in patterns:
-            benign_urls.append(f"{pre}{d}{suf}")
-
-    benign = pd.DataFrame({
-        'url': benign_urls,
-        'label': 'legit'
-    })
+    benign_urls = [f"{pre}{d}{suf}" for d, (pre, suf) in product(top_domains, patterns)]
 
-    # 5) Combine & shuffle
-    df = pd.concat([phish, benign], ignore_index=True)
-    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+    # 5) Combine & shuffle (one permutation over the combined arrays)
+    urls = np.concatenate([phish_urls, np.array(benign_urls, dtype=object)])
+    labels = np.repeat(np.array(['phishing', 'legit'], dtype=object),
+                       [len(phish_urls), len(benign_urls)])
+    order = np.random.default_rng(42).permutation(len(urls))
+    df = pd.DataFrame({'url': urls[order], 'label': labels[order]})
 
     # 6) Save
     df.to_csv('urls_and_labels.csv', index=False)
     print(f"✅ urls_and_labels.csv created with {len(df)} rows "
-          f"({len(benign)} legit, {len(phish)} phishing)")
+          f"({len(benign_urls)} legit, {len(phish_urls)} phishing)")
 
 if __name__ == '__main__':
     main()
@@ -4,25 +4,41 @@ from __future__ import annotations
 import os
 import json
 import time
+import queue
 import secrets
-from typing import Any, Dict, Tuple
-from urllib.parse import urlparse, urljoin
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urljoin
 
 import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import joblib
+from cachetools import TTLCache
 import tldextract  # make sure this is installed
 
+try:  # optional: serve tree ensembles through ONNX Runtime
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+try:  # optional: Bloom pre-check for very large PHG_TRUSTED_FILE lists
+    from rbloom import Bloom
+except ImportError:
+    Bloom = None
+
 from feature_extractor import (
     extract_features_with_meta,
     DEFAULT_CACHE_PATH,
 )
 from crypto_utils import (
     load_or_make_hmac_key,
-    load_or_make_rsa,
+    load_or_make_signing_key,
+    sig_alg_name,
     sign_and_mac,
 )
 
@@ -40,7 +56,7 @@ CORS(app)
 # --------------------------------------------------------------------
 # Config / environment
 # --------------------------------------------------------------------
-SHORTENERS = {"bit.ly", "goo.gl", "tinyurl.com", "ow.ly", "is.gd", "t.co"}
+SHORTENERS = frozenset({"bit.ly", "goo.gl", "tinyurl.com", "ow.ly", "is.gd", "t.co"})
 
 def _env_bool(name: str, default: bool) -> bool:
     v = os.getenv(name)
@@ -51,12 +67,20 @@ def _env_bool(name: str, default: bool) -> bool:
 MIN_THRESHOLD     = float(os.getenv("MIN_THRESHOLD", "0.35"))
 VERDICT_TTL_SECS  = int(os.getenv("VERDICT_TTL_SECS", "300"))
 
+# Micro-batching: concurrent /predict calls arriving within BATCH_WINDOW_MS are
+# scored with one predict_proba call (MAX_BATCH=1 scores each request inline)
+MAX_BATCH         = max(1, int(os.getenv("MAX_BATCH", "32")))
+BATCH_WINDOW_MS   = float(os.getenv("BATCH_WINDOW_MS", "5"))
+
 # Inference feature toggles (you can flip with env vars at runtime)
 PHG_DISABLE_DOM   = _env_bool("PHG_DISABLE_DOM",   True)   # default True = calmer demo
 PHG_DISABLE_CT    = _env_bool("PHG_DISABLE_CT",    False)
 PHG_DISABLE_WHOIS = _env_bool("PHG_DISABLE_WHOIS", False)
 URL_ONLY          = _env_bool("URL_ONLY",          False)
 
+# Verdict signature: "rsa" (PKCS#1 v1.5, default) or "ed25519" (much faster signing)
+SIG_ALG           = os.getenv("SIG_ALG", "rsa").strip().lower()
+
 # Reputation layer
 USE_REPUTATION    = _env_bool("USE_REPUTATION",    True)
 PHG_TRUSTED_FILE  = os.getenv("PHG_TRUSTED_FILE", "").strip()
@@ -84,8 +108,29 @@ def _load_extra_trusted(path: str) -> set[str]:
         pass
     return s
 
-EXTRA_TRUSTED = _load_extra_trusted(PHG_TRUSTED_FILE)
-TRUSTED_ALL = TRUSTED_ETLD1 | EXTRA_TRUSTED
+EXTRA_TRUSTED = frozenset(_load_extra_trusted(PHG_TRUSTED_FILE))
+# Counted instead of materializing TRUSTED_ETLD1 | EXTRA_TRUSTED, so a large
+# trust file is held in memory once
+TRUSTED_COUNT = len(EXTRA_TRUSTED) + len(TRUSTED_ETLD1 - EXTRA_TRUSTED)
+
+# For very large trust files, a Bloom filter rejects the (common) untrusted
+# case without probing the big set; positives are confirmed against the set
+BLOOM_MIN_TRUSTED = 50_000
+TRUSTED_BLOOM = None
+if Bloom is not None and len(EXTRA_TRUSTED) > BLOOM_MIN_TRUSTED:
+    TRUSTED_BLOOM = Bloom(len(EXTRA_TRUSTED), 1e-6)
+    TRUSTED_BLOOM.update(EXTRA_TRUSTED)
+
+def _is_trusted(d: str) -> bool:
+    if d in TRUSTED_ETLD1:
+        return True
+    if TRUSTED_BLOOM is not None and d not in TRUSTED_BLOOM:
+        return False
+    return d in EXTRA_TRUSTED
+
+# Bundled Public Suffix List snapshot, built once: no PSL fetch or cache-dir
+# lookups on the request path
+_TLD = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
 
 # --------------------------------------------------------------------
 # Model + metadata
@@ -97,6 +142,8 @@ def _safe_load_json(path: str, default: Dict[str, Any]) -> Dict[str, Any]:
     except Exception:
         return dict(default)
 
+# Loaded once in the gunicorn master and shared copy-on-write by the workers
+# (see gunicorn.conf.py, preload_app)
 model = joblib.load("best_model.pkl")
 
 feature_meta = _safe_load_json("feature_meta.json", {"n_features": 86})
@@ -108,46 +155,205 @@ MODEL_NAME = str(model_meta.get("best_model", "unknown"))
 
 EFFECTIVE_TAU = max(TAU, MIN_THRESHOLD)
 
+# ONNX export of the bare classifier (see model_training.export_onnx); used only
+# when the pickled model can apply its isotonic map separately via calibrate()
+ONNX_PATH = model_meta.get("onnx")
+USE_ORT = bool(ort is not None and ONNX_PATH and os.path.exists(ONNX_PATH) and hasattr(model, "calibrate"))
+# One intra-op thread per session by default: gunicorn already runs a worker
+# per core, so more threads per worker would only oversubscribe the CPUs
+ORT_THREADS = int(os.getenv("ORT_THREADS", "1"))
+
+_ORT_LOCK = threading.Lock()
+_ORT_SESS = None
+_ORT_PID: Optional[int] = None
+
+def _ort_session():
+    # Created per process on first use: an ONNX Runtime session (and its thread
+    # pool) must not be created in the preloading master and inherited by fork.
+    global _ORT_SESS, _ORT_PID
+    pid = os.getpid()
+    if _ORT_PID != pid:
+        with _ORT_LOCK:
+            if _ORT_PID != pid:
+                so = ort.SessionOptions()
+                so.enable_mem_pattern = True
+                so.intra_op_num_threads = ORT_THREADS
+                _ORT_SESS = ort.InferenceSession(ONNX_PATH, so, providers=["CPUExecutionProvider"])
+                _ORT_PID = pid
+    return _ORT_SESS
+
+def _score(X: np.ndarray) -> np.ndarray:
+    """Calibrated phishing probabilities for a float32 (B, N_FEATS) block."""
+    if USE_ORT:
+        sess = _ort_session()
+        return model.calibrate(sess.run(None, {sess.get_inputs()[0].name: X})[1][:, 1])
+    return model.predict_proba(X)[:, 1]
+
+# --------------------------------------------------------------------
+# Batched inference
+# --------------------------------------------------------------------
+class _Pending:
+    __slots__ = ("feats", "done", "proba", "error")
+
+    def __init__(self, feats: List[float]):
+        self.feats = feats
+        self.done = threading.Event()
+        self.proba: float = 0.0
+        self.error: Optional[BaseException] = None
+
+_BATCH_Q: "Optional[queue.Queue[_Pending]]" = None  # created with the worker
+# Rows are written into reused float32 buffers (trees split on float32 anyway,
+# so float64 input only costs an extra conversion copy inside the model)
+_BATCH_BUF = np.zeros((MAX_BATCH, N_FEATS), dtype=np.float32)  # owned by the worker
+_SCRATCH = threading.local()                                   # MAX_BATCH=1 path
+_BATCH_LOCK = threading.Lock()
+_BATCH_PID: Optional[int] = None
+
+def _batch_worker() -> None:
+    window = BATCH_WINDOW_MS / 1000.0
+    while True:
+        batch = [_BATCH_Q.get()]
+        deadline = time.monotonic() + window
+        while len(batch) < MAX_BATCH:
+            left = deadline - time.monotonic()
+            try:
+                batch.append(_BATCH_Q.get(timeout=left) if left > 0 else _BATCH_Q.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for i, p in enumerate(batch):
+                _BATCH_BUF[i] = p.feats
+            X = _BATCH_BUF[:len(batch)]
+            for p, pr in zip(batch, _score(X).tolist()):
+                p.proba = pr
+        except Exception as e:
+            for p in batch:
+                p.error = e
+        for p in batch:
+            p.done.set()
+
+def _ensure_batch_worker() -> None:
+    # Started lazily and per process: threads don't survive a fork, so a
+    # worker started at import would be missing in gunicorn/reloader children.
+    # The queue is created here too, after gevent has patched the worker.
+    global _BATCH_PID, _BATCH_Q
+    pid = os.getpid()
+    if _BATCH_PID == pid:
+        return
+    with _BATCH_LOCK:
+        if _BATCH_PID != pid:
+            _BATCH_Q = queue.Queue()
+            threading.Thread(target=_batch_worker, name="predict-batcher", daemon=True).start()
+            _BATCH_PID = pid
+
+def predict_proba_one(feats: List[float]) -> float:
+    """Phishing probability for one feature row, via the micro-batching worker."""
+    if MAX_BATCH == 1:
+        buf = getattr(_SCRATCH, "buf", None)
+        if buf is None:
+            buf = _SCRATCH.buf = np.zeros((1, N_FEATS), dtype=np.float32)
+        buf[0] = feats
+        return float(_score(buf)[0])
+    _ensure_batch_worker()
+    p = _Pending(feats)
+    _BATCH_Q.put(p)
+    p.done.wait()
+    if p.error is not None:
+        raise p.error
+    return p.proba
+
 # --------------------------------------------------------------------
 # Crypto
 # --------------------------------------------------------------------
 HMAC_KEY = load_or_make_hmac_key()
-RSA_PRIV, RSA_PUB, PUBKEY_PEM = load_or_make_rsa()
+SIGN_PRIV, SIGN_PUB, PUBKEY_PEM = load_or_make_signing_key(SIG_ALG)
+SIG_ALG_NAME = sig_alg_name(SIGN_PRIV)
+
+# --------------------------------------------------------------------
+# Verdict cache
+# --------------------------------------------------------------------
+# Signed responses for repeat URLs are served as-is (same serialized bytes,
+# nonce and req_id) while they still have at least half their validity left;
+# clients check `exp`.
+_VERDICTS: TTLCache = TTLCache(maxsize=10_000, ttl=max(1, VERDICT_TTL_SECS // 2))
+_VERDICTS_LOCK = threading.Lock()
+
+def _verdict_key(raw_url: str) -> tuple:
+    return (raw_url, PHG_DISABLE_DOM, PHG_DISABLE_CT, PHG_DISABLE_WHOIS, URL_ONLY, USE_REPUTATION)
+
+def _json_bytes(data: bytes, status: int = 200):
+    return app.response_class(data, status=status, mimetype="application/json")
 
 # --------------------------------------------------------------------
 # Helpers
 # --------------------------------------------------------------------
+# Shared session for shortener expansion: keep-alive connections are reused
+# across requests instead of a fresh TCP/TLS handshake per expansion
+_HTTP = requests.Session()
+_HTTP.headers.update({"User-Agent": "Mozilla/5.0"})
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+_HTTP.mount("https://", _HTTP_ADAPTER)
+_HTTP.mount("http://", _HTTP_ADAPTER)
+
+# Resolved shortener targets (successful lookups only; failures retry next time)
+_EXPANDED: TTLCache = TTLCache(maxsize=20_000, ttl=3600)
+_EXPANDED_LOCK = threading.Lock()
+
+# A meta refresh lives in <head>; never download more than this of the page
+META_PROBE_BYTES = 8192
+
+def _follow_shortener(url: str) -> tuple[str, bool]:
+    """
+    Follow redirects / meta-refresh once; raises on network errors.
+    Returns (target, ok) where ok is False for 4xx/5xx responses.
+    """
+    with _HTTP.get(url, timeout=5, allow_redirects=True, stream=True) as r:
+        ok = r.ok
+        if r.url and r.url != url:
+            return r.url, ok
+        head = r.raw.read(META_PROBE_BYTES, decode_content=True)
+
+    tree = LexborHTMLParser(head)
+    meta = next((m for m in tree.css("meta[http-equiv]")
+                 if (m.attributes.get("http-equiv") or "").lower() == "refresh"), None)
+    content = meta.attributes.get("content") if meta is not None else None
+    if content is not None:
+        parts = [s.strip() for s in content.split(";")]
+        for part in parts:
+            if part.lower().startswith("url="):
+                return urljoin(url, part[4:].strip(" '\"")), ok
+    return url, ok
+
 def expand_url(url: str) -> str:
     """Expand shorteners by following redirects or meta-refresh."""
     if "://" not in url:
         url = "http://" + url
-    host = urlparse(url).netloc.lower()
+    host = urlsplit(url).netloc.lower()
     if host not in SHORTENERS:
         return url
 
+    with _EXPANDED_LOCK:
+        hit = _EXPANDED.get(url)
+    if hit is not None:
+        return hit
     try:
-        r = requests.get(url, timeout=5, allow_redirects=True,
-                         headers={"User-Agent": "Mozilla/5.0"})
-        if r.url and r.url != url:
-            return r.url
-
-        soup = BeautifulSoup(r.text, "html.parser")
-        meta = soup.find("meta", attrs={"http-equiv": lambda v: v and v.lower() == "refresh"})
-        if meta and "content" in meta.attrs:
-            parts = [s.strip() for s in meta["content"].split(";")]
-            for part in parts:
-                if part.lower().startswith("url="):
-                    return urljoin(url, part[4:].strip(" '\""))
+        target, ok = _follow_shortener(url)
     except Exception:
-        pass
-    return url
-
+        return url
+    # Don't pin a failed or non-expanding lookup (e.g. a 503 from the
+    # shortener) for the whole TTL; the next request should try again.
+    if ok and target != url:
+        with _EXPANDED_LOCK:
+            _EXPANDED[url] = target
+    return target
+
+@lru_cache(maxsize=4096)
 def etld1_from_url(url: str) -> str:
-    e = tldextract.extract(url)
+    e = _TLD(url)
     if e.suffix:
         return f"{e.domain}.{e.suffix}".lower()
     # fallback
-    return (e.domain or urlparse(url).netloc).lower()
+    return (e.domain or urlsplit(url).netloc).lower()
 
 def _apply_feature_toggles(feats: list[float]) -> dict:
     """
@@ -184,14 +390,14 @@ def _apply_feature_toggles(feats: list[float]) -> dict:
 
 def _apply_reputation(url: str, proba: float) -> Tuple[float, dict]:
     """
-    If reputation is enabled and the domain is in TRUSTED_ALL, cap the phish
+    If reputation is enabled and the domain is trusted, cap the phish
     probability at 5%. Returns (new_proba, rep_info).
     """
     if not USE_REPUTATION:
         return proba, {"used": False}
 
     d = etld1_from_url(url)
-    if d in TRUSTED_ALL:
+    if _is_trusted(d):
         return min(proba, 0.05), {"used": True, "etld1": d, "label": "trusted", "source": "builtin+file"}
     return proba, {"used": False, "etld1": d}
 
@@ -212,9 +418,11 @@ def health():
         "ok": True,
         "features": N_FEATS,
         "model": MODEL_NAME,
+        "runtime": "onnxruntime" if USE_ORT else "sklearn",
         "threshold": TAU,
         "effective_threshold": EFFECTIVE_TAU,
         "ttl_secs": VERDICT_TTL_SECS,
+        "sig_alg": SIG_ALG_NAME,
         "toggles": {
             "PHG_DISABLE_DOM": PHG_DISABLE_DOM,
             "PHG_DISABLE_CT": PHG_DISABLE_CT,
@@ -222,7 +430,7 @@ def health():
             "URL_ONLY": URL_ONLY,
             "USE_REPUTATION": USE_REPUTATION,
         },
-        "trusted_count": len(TRUSTED_ALL),
+        "trusted_count": TRUSTED_COUNT,
     })
 
 @app.route("/predict", methods=["POST"])
@@ -231,11 +439,17 @@ def predict():
     try:
         data = request.get_json(force=True) or {}
     except Exception:
-        return jsonify({"error": "invalid JSON"}), 400
+        return _json_bytes(orjson.dumps({"error": "invalid JSON"}), 400)
 
     raw_url = (data.get("url") or "").strip()
     if not raw_url:
-        return jsonify({"error": "missing url"}), 400
+        return _json_bytes(orjson.dumps({"error": "missing url"}), 400)
+
+    key = _verdict_key(raw_url)
+    with _VERDICTS_LOCK:
+        cached = _VERDICTS.get(key)
+    if cached is not None:
+        return _json_bytes(cached)
 
     url = expand_url(raw_url)
 
@@ -245,14 +459,17 @@ def predict():
         cache_path=str(DEFAULT_CACHE_PATH),
         network_mode="cache-first",
     )
-    feats = (feats + [0.0] * (N_FEATS - len(feats)))[:N_FEATS]
+    n = len(feats)
+    if n < N_FEATS:                  # normally n == N_FEATS: nothing to do
+        feats.extend([0.0] * (N_FEATS - n))
+    elif n > N_FEATS:
+        del feats[N_FEATS:]
 
     # ---- toggles ----
     toggles_applied = _apply_feature_toggles(feats)
 
     # ---- inference ----
-    X = np.asarray(feats, dtype=float).reshape(1, -1)
-    proba = float(model.predict_proba(X)[0, 1])
+    proba = predict_proba_one(feats)
 
     # ---- reputation prior (caps proba for top trusted sites) ----
     proba, rep_info = _apply_reputation(url, proba)
@@ -282,14 +499,19 @@ def predict():
         "req_id": secrets.token_hex(8),
     }
 
-    sigs = sign_and_mac(payload, HMAC_KEY, RSA_PRIV)
+    sigs = sign_and_mac(payload, HMAC_KEY, SIGN_PRIV)
 
-    return jsonify({
+    body = {
         "payload": payload,
         "hmac": sigs["hmac"],
         "signature": sigs["signature"],
+        "sig_alg": SIG_ALG_NAME,
         "pubkey_pem": PUBKEY_PEM
-    })
+    }
+    data = orjson.dumps(body)
+    with _VERDICTS_LOCK:
+        _VERDICTS[key] = data
+    return _json_bytes(data)
 
 # --------------------------------------------------------------------
 # Main
@@ -298,5 +520,7 @@ if __name__ == "__main__":
     print("🔌 PhishGuard 414 API: http://127.0.0.1:5000")
     print(f"   Model: {MODEL_NAME} | features={N_FEATS} | τ={TAU} | τ*={EFFECTIVE_TAU}")
     print(f"   Toggles: DOM={'OFF' if PHG_DISABLE_DOM else 'ON'}, CT={'OFF' if PHG_DISABLE_CT else 'ON'}, WHOIS={'OFF' if PHG_DISABLE_WHOIS else 'ON'}, URL_ONLY={'ON' if URL_ONLY else 'OFF'}")
-    print(f"   Reputation: USE_REPUTATION={'ON' if USE_REPUTATION else 'OFF'} | trusted domains={len(TRUSTED_ALL)} (+ {len(EXTRA_TRUSTED)} from file)")
+    print(f"   Batching: MAX_BATCH={MAX_BATCH} | window={BATCH_WINDOW_MS}ms")
+    print(f"   Reputation: USE_REPUTATION={'ON' if USE_REPUTATION else 'OFF'} | trusted domains={TRUSTED_COUNT} (+ {len(EXTRA_TRUSTED)} from file)")
+    # Dev server only; deploy with gunicorn (see wsgi.py)
     app.run(host="127.0.0.1", port=5000, debug=True)
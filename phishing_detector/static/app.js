@@ -20,15 +20,16 @@ function pemToArrayBuffer(pem){
   return buf;
 }
 
-async function verifyRSA(payload, sigB64, pubPem){
+async function verifySignature(payload, sigB64, pubPem, alg = "RSASSA-PKCS1-v1_5"){
   const data = new TextEncoder().encode(canonicalJSONString(payload));
+  const params = alg === "Ed25519" ? {name:"Ed25519"} : {name:"RSASSA-PKCS1-v1_5", hash:"SHA-256"};
   const key = await crypto.subtle.importKey(
     "spki", pemToArrayBuffer(pubPem),
-    {name:"RSASSA-PKCS1-v1_5", hash:"SHA-256"},
+    params,
     false, ["verify"]
   );
   const sig = Uint8Array.from(atob(sigB64), c => c.charCodeAt(0));
-  return crypto.subtle.verify("RSASSA-PKCS1-v1_5", key, sig, data);
+  return crypto.subtle.verify(params.name, key, sig, data);
 }
 
 function ts(unixSeconds){
@@ -138,8 +139,10 @@ async function verify(){
   if(!last) return;
   verifyBtn.disabled = true;
   verifyStatus.textContent = "Verifying…";
-  const ok = await verifyRSA(last.payload, last.signature, last.pubkey_pem).catch(() => false);
-  verifyStatus.textContent = ok ? "✅ RSA signature verified" : "❌ verification failed";
+  const alg = last.sig_alg || "RSASSA-PKCS1-v1_5";
+  const ok = await verifySignature(last.payload, last.signature, last.pubkey_pem, alg).catch(() => false);
+  const label = alg === "Ed25519" ? "Ed25519" : "RSA";
+  verifyStatus.textContent = ok ? `✅ ${label} signature verified` : "❌ verification failed";
   verifyBtn.disabled = false;
 }
 
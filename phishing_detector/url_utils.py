@@ -0,0 +1,23 @@
+# url_utils.py
+# eTLD+1 helpers shared by the dataset scripts (curate_urls, group_split, check_overlap).
+import re
+from functools import lru_cache
+
+import tldextract
+
+# Only a scheme at the very start counts; a "://" inside the query
+# (e.g. ?next=https://paypal.com) must not be mistaken for one.
+SCHEME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*://")
+HOST_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)")
+
+def with_scheme(u: str) -> str:
+    return u if SCHEME_RE.match(u) else ("http://" + u)
+
+# Keyed by host so repeated domains (the common case) skip tldextract
+@lru_cache(maxsize=200_000)
+def etld1_host(host: str) -> str:
+    e = tldextract.extract("http://" + host)
+    return (f"{e.domain}.{e.suffix}".lower() if e.suffix else e.domain.lower())
+
+def etld1(u: str) -> str:
+    return etld1_host(HOST_RE.match(with_scheme(u)).group(1).lower())
@@ -2,7 +2,7 @@
 """
 warm_cache.py
 
-Pre-populates feature_cache.json by fetching WHOIS / CT / DOM signals
+Pre-populates the feature cache (feature_cache.sqlite) by fetching WHOIS / CT / DOM signals
 for a set of trusted, well-known legit domains (and anything you pass in).
 This makes inference stable even when your machine is offline or the
 target sites throttle requests.
@@ -11,9 +11,11 @@ Usage:
   python warm_cache.py
   python warm_cache.py --add https://www.wikipedia.org https://www.google.com
   python warm_cache.py --file extra_urls.txt
-  python warm_cache.py --cache my_cache.json
+  python warm_cache.py --cache my_cache.sqlite
+  python warm_cache.py --workers 16
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import argparse
 from typing import List
@@ -50,7 +52,8 @@ def main():
     ap = argparse.ArgumentParser(description="Warm feature cache for trusted domains.")
     ap.add_argument("--add", nargs="*", default=[], help="Additional URLs to warm (space-separated).")
     ap.add_argument("--file", help="Path to a text file with one URL per line.")
-    ap.add_argument("--cache", help="Cache file path (default: feature_cache.json).")
+    ap.add_argument("--cache", help="Cache file path (default: feature_cache.sqlite).")
+    ap.add_argument("--workers", type=int, default=8, help="Concurrent fetches (default: 8).")
     args = ap.parse_args()
 
     urls = list(TRUSTED_DEFAULT)
@@ -71,19 +74,27 @@ def main():
 
     ok, fallback = 0, 0
     print(f"→ warming cache at {cache_path}")
-    for u in ordered:
-        try:
-            _, meta = extract_features_with_meta(
-                u, cache_path=cache_path, network_mode="fetch"  # force network on miss
-            )
+    # WHOIS/CT/DOM fetches are network-bound; cache writes are serialized
+    # inside feature_extractor, so URLs can be warmed concurrently
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+        futs = {
+            ex.submit(extract_features_with_meta, u, cache_path=cache_path,
+                      network_mode="fetch"): u  # force network on miss
+            for u in ordered
+        }
+        for fut in as_completed(futs):
+            u = futs[fut]
+            try:
+                _, meta = fut.result()
+            except Exception as e:
+                print(f"   {u:60s}  ERROR: {e}")
+                continue
             src = meta.get("sources", {})
             fb = bool(meta.get("used_fallback", False))
             print(f"   {u:60s}  sources={src}  fallback={fb}")
             ok += 1
             if fb:
                 fallback += 1
-        except Exception as e:
-            print(f"   {u:60s}  ERROR: {e}")
 
     print(f"\n✅ Done. Wrote/updated: {cache_path}")
     print(f"   Warmed: {ok}, with fallback: {fallback}")
@@ -0,0 +1,9 @@
+# wsgi.py
+# Production entry point for the PhishGuard 414 API:
+#   gunicorn wsgi:app        (settings in gunicorn.conf.py)
+# (cooperative workers keep slow shortener expansions / feature fetches from
+# blocking other requests; `python phishing_api.py` is the dev server)
+
+from phishing_api import app
+
+__all__ = ["app"]